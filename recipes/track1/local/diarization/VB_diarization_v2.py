@@ -78,7 +78,8 @@ def VB_diarization(X,filename, m, iE, w, V, sp=None, q=None,
   the paper above).
 
   Inputs:
-  X  - T x D array, where columns are D dimensional feature vectors for T frames
+  X  - T x D array, where columns are D dimensional feature vectors for T frames;
+       m, iE, and V are converted to the dtype of X
   m  - C x D array of GMM component means
   iE - C x D array of GMM component inverse covariance matrix diagonals
   w  - C dimensional column vector of GMM component weights
@@ -124,6 +125,11 @@ def VB_diarization(X,filename, m, iE, w, V, sp=None, q=None,
   R=V.shape[0]  # subspace rank
   nframes=X.shape[0]
 
+  # Work at the precision of the features (e.g., float32 for Kaldi MFCCs).
+  m = m.astype(X.dtype, copy=False)
+  iE = iE.astype(X.dtype, copy=False)
+  V = V.astype(X.dtype, copy=False)
+
   if VtiEV is None:
     VtiEV = precalculate_VtiEV(V, iE)
 
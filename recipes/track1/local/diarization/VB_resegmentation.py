@@ -29,18 +29,46 @@ References
 # - Neville Ryant  --  major refactoring, improved documentation, and PEP8
 #   adherence
 import argparse
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import (
+    Future, ProcessPoolExecutor, ThreadPoolExecutor)
+import contextlib
 from dataclasses import dataclass
+from functools import partial
+import io
+import multiprocessing
+import os
 from pathlib import Path
 import pickle
 import sys
+import tempfile
 
 import kaldi_io
+try:
+    import kaldi_native_io
+except ImportError:
+    kaldi_native_io = None
 import numpy as np
+try:
+    import numba
+except ImportError:
+    numba = None
 
 import VB_diarization_v2 as VB_diarization
 
 
+# Diagonal UBM and i-vector extractor parameters. These are set once per process
+# by ``_init_globals`` rather than passed with every recording. Worker processes
+# memory-map them from files written by the main process (see ``_init_worker``)
+# so that the large, read-only arrays are shared rather than copied per worker.
+_MODEL = {}
+_MODEL_PARAMS = ('m', 'iE', 'w', 'V', 'VtiEV')
+
+# Scratch buffers reused across the recordings processed by a process; see
+# ``_get_buffer``.
+_BUFFERS = {}
+
+
 def load_dubm(fpath):
     """Load diagonal UBM parameters.
 
@@ -91,45 +119,150 @@ def load_frame_counts(fpath):
     - URI
     - frame count
     """
-    frame_counts = {}
+    fields = np.loadtxt(
+        fpath, dtype=str, usecols=(0, 1), comments=None, ndmin=2)
+    uris = fields[:, 0].tolist()
+    n_frames = fields[:, 1].astype(np.int64).tolist()
+    frame_counts = dict(zip(uris, n_frames))
+    return frame_counts
+
+
+def load_scp(fpath):
+    """Load mapping from URIs to extended filenames from Kaldi script file.
+
+    Each line of ``fpath`` is expected to consist of a URI followed by an
+    extended filename; e.g.:
+
+        DH_DEV_0001 /path/to/raw_mfcc.1.ark:12
+    """
+    rxfilenames = {}
     with open(fpath, 'r') as f:
         for line in f:
-            uri, n_frames = line.strip().split()
-            n_frames = int(n_frames)
-            frame_counts[uri] = n_frames
-    return frame_counts
+            uri, rxfilename = line.strip().split(maxsplit=1)
+            rxfilenames[uri] = rxfilename
+    return rxfilenames
+
+
+def load_feats(rxfilename):
+    """Load feature matrix from Kaldi extended filename.
+
+    Uses the C++ reader from ``kaldi_native_io`` if it is installed and falls
+    back to ``kaldi_io`` otherwise.
+
+    Parameters
+    ----------
+    rxfilename : str
+        Kaldi extended filename; e.g., ``/path/to/raw_mfcc.1.ark:12``.
+
+    Returns
+    -------
+    feats : ndarray, (n_frames, n_dims)
+        Feature matrix.
+    """
+    if kaldi_native_io is not None:
+        return kaldi_native_io.FloatMatrix.read(rxfilename).numpy()
+    return kaldi_io.read_mat(rxfilename)
 
 
 @dataclass
-class Segment:
-    """Speech segment.
+class Segmentation:
+    """Speaker segmentation of a recording.
+
+    Stores onsets/offsets and speakers of segments from a recording as parallel
+    arrays.
 
     Parameters
     ----------
     recording_id : str
-        URI for recording segment is from.
+        URI for recording segmentation is from.
 
-    onset : int
-        Index in frames of segment onset (0-indexed).
+    onsets : ndarray, (n_segments,)
+        ``onsets[i]`` is the index in frames of the onset of the ``i``-th
+        segment (0-indexed).
 
-    offset : int
-        Index in frames of segment offset (0-indexed).
+    offsets : ndarray, (n_segments,)
+        ``offsets[i]`` is the index in frames of the offset of the ``i``-th
+        segment (0-indexed).
 
-    speaker_id : str
-        Speaker id.
+    speaker_labels : ndarray, (n_segments,)
+        ``speaker_labels[i]`` is the integer id (>1) of the speaker of the
+        ``i``-th segment. See ``get_labels``.
     """
     recording_id: str
-    onset: int
-    offset: int
-    speaker_id: str
-
-    @property
-    def duration(self):
-        """Duration in frames of segment."""
-        return self.offset - self.onset + 1
-
-
-def load_rttm(rttm_path, frame_counts, step=0.01, target_rec_ids=None):
+    onsets: np.ndarray
+    offsets: np.ndarray
+    speaker_labels: np.ndarray
+
+    def __post_init__(self):
+        self.onsets = np.asarray(self.onsets, dtype=np.int32)
+        self.offsets = np.asarray(self.offsets, dtype=np.int32)
+        self.speaker_labels = np.asarray(self.speaker_labels, dtype=np.int32)
+        if not (len(self.onsets) == len(self.offsets) ==
+                len(self.speaker_labels)):
+            raise ValueError(
+                '"onsets", "offsets", and "speaker_labels" must have same '
+                'length.')
+
+
+def _read_rttm_turns(rttm_path):
+    """Parse speaker turns from RTTM file.
+
+    Returns a tuple ``(lines, recording_ids, onsets, offsets, speaker_ids)``,
+    where ``lines`` is a list of the non-empty lines of the file and the
+    remaining elements are arrays with one entry per line.
+    """
+    with open(rttm_path, 'r') as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        empty = np.empty(0, dtype=str)
+        return lines, empty, np.empty(0), np.empty(0), empty
+
+    # Parse all turns at once. Columns are recording id, onset, duration, and
+    # speaker id.
+    fields = np.loadtxt(
+        lines, dtype=str, usecols=(1, 3, 4, 7), comments=None, ndmin=2)
+    recording_ids = fields[:, 0]
+    speaker_ids = fields[:, 3]
+    onsets = fields[:, 1].astype(np.float64)
+    offsets = onsets + fields[:, 2].astype(np.float64)
+    return lines, recording_ids, onsets, offsets, speaker_ids
+
+
+def _read_rttm_turns_cached(rttm_path):
+    """Like ``_read_rttm_turns``, but cache the result in a pickle file.
+
+    The cache is stored alongside the RTTM file as ``<rttm_path>.parsed.pkl``
+    and is only used if the modification time and size of the RTTM file are
+    unchanged since it was written.
+    """
+    cache_path = Path(f'{rttm_path}.parsed.pkl')
+    stat = os.stat(rttm_path)
+    fingerprint = (stat.st_mtime_ns, stat.st_size)
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_fingerprint, turns = pickle.load(f)
+        if cached_fingerprint == fingerprint:
+            return turns
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        pass
+    turns = _read_rttm_turns(rttm_path)
+
+    # Write to a temporary file first so that concurrent jobs reading the
+    # same RTTM never see a partial cache.
+    tmp_path = Path(f'{cache_path}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((fingerprint, turns), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f'WARNING: Unable to write RTTM cache "{cache_path}": {e}')
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+    return turns
+
+
+def load_rttm(rttm_path, frame_counts, step=0.01, target_rec_ids=None,
+              cache=False):
     """Load recording segmentations from RTTM file.
 
     Parameters
@@ -149,49 +282,138 @@ def load_rttm(rttm_path, frame_counts, step=0.01, target_rec_ids=None):
         ``target_rec_ids``.
         (Default: None)
 
+    cache : bool, optional
+        If True, cache the parsed RTTM file in ``<rttm_path>.parsed.pkl`` and
+        reuse it in subsequent calls if the RTTM file is unchanged.
+        (Default: False)
+
     Returns
     -------
     recordings : dict
-        Mapping from recording ids to speech segments.
+        Mapping from recording ids to speech segments, stored as
+        ``Segmentation`` instances. Within each recording, speakers are
+        assigned integer ids >1 based on their first turn.
     """
-    recordings = defaultdict(list)
-    with open(rttm_path, 'r') as f:
-        for line in f:
-            fields = line.strip().split()
-            recording_id = fields[1]
-
-            # Skip segments from non-target recordings.
-            if target_rec_ids and recording_id not in target_rec_ids:
-                continue
-
-            # Check sane segment boundaries.
-            onset = float(fields[3])
-            offset = onset + float(fields[4])
-            onset_frames = int(onset/step)
-            offset_frames = int(offset/step)
-            n_frames = frame_counts[recording_id]
-            if offset_frames >= n_frames:
-                offset_frames = n_frames - 1
-                print(
-                    f"WARNING: Speaker turn extends past end of recording. "
-                    f"LINE: {line}")
-            if not 0 <= onset_frames <= offset_frames:
-                # Note that offset_frames was previously truncated to
-                # at most the actual length of the recording as we
-                # anticipate the initial diarization may be sloppy at
-                # the edges.
-                raise ValueError(
-                    f"Impossible segment boundaries. LINE: {line}")
-
-            # Create new speech segment.
-            speaker_id = fields[7]
-            recordings[recording_id].append(
-                Segment(recording_id, onset_frames, offset_frames, speaker_id))
+    recordings = {}
+    read_turns = _read_rttm_turns_cached if cache else _read_rttm_turns
+    lines, recording_ids, onsets, offsets, speaker_ids = read_turns(rttm_path)
+    if not lines:
+        return recordings
+
+    # Skip segments from non-target recordings.
+    inds = np.arange(len(lines))
+    if target_rec_ids:
+        inds = np.flatnonzero(np.isin(recording_ids, list(target_rec_ids)))
+        if not len(inds):
+            return recordings
+    recording_ids = recording_ids[inds]
+    speaker_ids = speaker_ids[inds]
+
+    # Check sane segment boundaries.
+    onset_frames = (onsets[inds]/step).astype(np.int64)
+    offset_frames = (offsets[inds]/step).astype(np.int64)
+    n_frames = np.array(
+        [frame_counts[recording_id] for recording_id in recording_ids],
+        dtype=np.int64)
+    for ind in inds[offset_frames >= n_frames]:
+        print(
+            f"WARNING: Speaker turn extends past end of recording. "
+            f"LINE: {lines[ind]}")
+    offset_frames = np.minimum(offset_frames, n_frames - 1)
+    is_bad = ~((0 <= onset_frames) & (onset_frames <= offset_frames))
+    if is_bad.any():
+        # Note that offset_frames was previously truncated to at most the
+        # actual length of the recording as we anticipate the initial
+        # diarization may be sloppy at the edges.
+        line = lines[inds[np.argmax(is_bad)]]
+        raise ValueError(
+            f"Impossible segment boundaries. LINE: {line}")
+
+    # Group segments by recording, preserving their order within each
+    # recording.
+    order = np.argsort(recording_ids, kind='stable')
+    recording_ids = recording_ids[order]
+    bis = np.flatnonzero(
+        np.concatenate([[True], recording_ids[1:] != recording_ids[:-1]]))
+    eis = np.append(bis[1:], len(order))
+    for bi, ei in zip(bis, eis):
+        recording_id = sys.intern(str(recording_ids[bi]))
+        inds = order[bi:ei]
+
+        # Map string speaker ids to integers > 1s in order of first turn.
+        _, first_inds, speaker_inds = np.unique(
+            speaker_ids[inds], return_index=True, return_inverse=True)
+        speaker_ranks = np.empty_like(first_inds)
+        speaker_ranks[np.argsort(first_inds)] = np.arange(len(first_inds))
+        speaker_labels = speaker_ranks[speaker_inds.ravel()] + 2
+
+        recordings[recording_id] = Segmentation(
+            recording_id, onset_frames[inds], offset_frames[inds],
+            speaker_labels)
 
     return recordings
 
 
-def get_labels(segs, n_frames):
+def _label_dtype(max_label):
+    """Return smallest signed integer dtype that holds labels <= ``max_label``.
+
+    Frame labels are small integers, so storing them in narrow types reduces
+    the memory traffic of every pass over the labels.
+    """
+    for dtype in [np.int8, np.int16]:
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int32)
+
+
+def _fill_labels(onsets, offsets, speaker_labels, ref):
+    """Assign speaker labels to frames of ``ref`` in place.
+
+    Compiled with Numba when available; see ``get_labels``.
+    """
+    for k in range(len(onsets)):
+        speaker_label = speaker_labels[k]
+        for ind in range(onsets[k], offsets[k]+1):
+            if ref[ind] == 0:
+                ref[ind] = speaker_label
+            elif ref[ind] != speaker_label:
+                ref[ind] = 1
+
+
+if numba is not None:
+    _fill_labels = numba.njit(cache=True)(_fill_labels)
+
+
+def _sweep_labels(onsets, offsets, speaker_labels, ref):
+    """Assign speaker labels to frames of ``ref`` in place.
+
+    NumPy equivalent of ``_fill_labels`` that works on turn boundaries rather
+    than frames. The recording is split into elementary intervals at each
+    onset and one-past-offset; the set of speakers active within each interval
+    is constant, so each interval is labeled once and expanded to frames in a
+    single pass.
+    """
+    if len(onsets) == 0:
+        return
+    speakers, speaker_inds = np.unique(speaker_labels, return_inverse=True)
+    bounds = np.unique(np.concatenate([[0, len(ref)], onsets, offsets + 1]))
+
+    # Count the turns of each speaker active within each interval.
+    counts = np.zeros((len(bounds), len(speakers)), dtype=np.int32)
+    np.add.at(counts, (np.searchsorted(bounds, onsets), speaker_inds), 1)
+    np.add.at(counts, (np.searchsorted(bounds, offsets + 1), speaker_inds), -1)
+    is_active = np.cumsum(counts, axis=0)[:-1] > 0
+
+    # Intervals with no active speakers are silence and those with more than
+    # one are overlap.
+    n_active = is_active.sum(axis=1)
+    interval_labels = np.where(
+        n_active == 1, speakers[np.argmax(is_active, axis=1)],
+        np.minimum(n_active, 1))
+    ref[...] = np.repeat(interval_labels, np.diff(bounds))
+
+
+def get_labels(segs, n_frames, out=None, assume_no_overlap=False):
     """Return frame-wise labeling corresponding to a segmentation.
 
     The resulting labeling is an an array whose ``i``-th entry provides the label
@@ -201,71 +423,86 @@ def get_labels(segs, n_frames):
     - 1:   indicates more than one speaker present (i.e., overlapped speech)
     - n>1: integer id of the SOLE speaker present in frame
 
-    Speakers are assigned integer ids >1 based on their first turn in the
-    recording.
+    The integer id of each speaker is taken from ``segs.speaker_labels``.
 
     Parameters
     ----------
-    segs : iterable of Segment
+    segs : Segmentation
         Recording segments.
 
     n_frames : int
         Length of recording in frames.
 
+    out : ndarray, (n_frames,), optional
+        If provided, the labeling will be written to this array.
+        (Default: None)
+
+    assume_no_overlap : bool, optional
+        If True, label frames by painting the segments in order of onset,
+        which is faster when few segments share frames. Note that this is not
+        the case for AHC output, where adjacent turns often share a boundary
+        frame. The labels are the same either way.
+        (Default: False)
+
     Returns
     -------
     ref : ndarray, (n_frames,)
-        Framewise speaker labels.
+        Framewise speaker labels. Unless ``out`` is provided, stored using the
+        smallest integer dtype able to hold them.
     """
-    # Induce mapping from string speaker ids to integers > 1s.
-    n_speakers = 0
-    speaker_dict = {}
-    for seg in segs:
-        if seg.speaker_id in speaker_dict:
-            continue
-        n_speakers += 1
-        speaker_dict[seg.speaker_id] = n_speakers + 1
-
     # Create reference frame labeling:
     # - 0: non-speech
     # - 1: overlapping speech
     # - n>1: speaker n
     # We use 0 to denote silence frames and 1 to denote overlapping frames.
-    ref = np.zeros(n_frames, dtype=np.int32)
-    for seg in segs:
-        # Integer id of speaker.
-        speaker_label = speaker_dict[seg.speaker_id]
-
-        # Assign this label to all frames in the segment that are not
-        # already assigned.
-        for ind in range(seg.onset, seg.offset+1):
-            if ref[ind] == speaker_label:
-                # This shouldn't happen, but being paranoid in case the
-                # initialization contains overlapping segments by same speaker.
-                continue
-            elif ref[ind] == 0:
-                label = speaker_label
-            else:
-                # Overlapped speech.
-                label = 1
-            ref[ind] = label
-
+    if out is None:
+        max_label = segs.speaker_labels.max(initial=1)
+        ref = np.zeros(n_frames, dtype=_label_dtype(max_label))
+    else:
+        ref = out
+        ref.fill(0)
+    if assume_no_overlap:
+        # Paint segments in order of onset. The frames of a segment already
+        # covered by earlier segments are those up to the latest offset so far
+        # and become overlapped speech unless all were from the same speaker.
+        order = np.argsort(segs.onsets, kind='stable')
+        prev_offset = -1
+        for onset, offset, speaker_label in zip(
+                segs.onsets[order].tolist(), segs.offsets[order].tolist(),
+                segs.speaker_labels[order].tolist()):
+            if onset <= prev_offset:
+                shared = ref[onset:min(offset, prev_offset)+1]
+                shared[shared != speaker_label] = 1
+                onset = prev_offset + 1
+            ref[onset:offset+1] = speaker_label
+            prev_offset = max(prev_offset, offset)
+        return ref
+    # Frames covered by segments from a single speaker are assigned that
+    # speaker's label, while frames covered by segments from DIFFERENT speakers
+    # become overlapped speech. Frames covered by multiple segments from the
+    # same speaker (which shouldn't happen, but being paranoid in case the
+    # initialization contains overlapping segments by same speaker) keep that
+    # speaker's label.
+    fill_labels = _fill_labels if numba is not None else _sweep_labels
+    fill_labels(segs.onsets, segs.offsets, segs.speaker_labels, ref)
     return ref
 
 
 def print_diagnostics(labels):
     """Print diagnostics for labeling."""
-    n_speakers = labels.max() - 1
+    # All counts are derived from a single pass over the labels.
+    counts = np.bincount(labels, minlength=2)
+    n_speakers = len(counts) - 2
     print(f"# SPEAKERS: {n_speakers}")
     n_frames = len(labels)
-    n_sil_frames = np.sum(labels == 0)
+    n_sil_frames = counts[0]
     sil_prop = 100.* n_sil_frames / n_frames
-    n_overlap_frames = np.sum(labels == 1)
+    n_overlap_frames = counts[1]
     overlap_prop = 100.* n_overlap_frames / n_frames
     print(f"TOTAL: {n_frames} frames, "
           f"SILENCE: {n_sil_frames} frames ({sil_prop:.0f}%), "
           f"OVERLAP {n_overlap_frames} frames ({overlap_prop:.0f}%)")
-    speaker_hist = np.bincount(labels)[2:]
+    speaker_hist = counts[2:]
     speaker_dist = speaker_hist/speaker_hist.sum()
     print(f"SPEAKER FREQUENCIES (DISCOUNTING OVERLAPS): "
           f"{np.array2string(speaker_dist, precision=2, suppress_small=True)}")
@@ -298,25 +535,288 @@ def write_rttm_file(rttm_path, labels, channel=0, step=0.01, precision=2):
     """
     rttm_path = Path(rttm_path)
 
-    # Determine indices of onsets/offsets of speaker turns.
-    is_cp = np.diff(labels, n=1, prepend=-999, append=-999) != 0
-    cp_inds = np.nonzero(is_cp)[0]
+    # Determine indices of onsets/offsets of speaker turns. The first frame
+    # and one-past-the-last frame are always changepoints.
+    is_cp = np.empty(len(labels) + 1, dtype=bool)
+    is_cp[0] = is_cp[-1] = True
+    np.not_equal(labels[1:], labels[:-1], out=is_cp[1:-1])
+    cp_inds = np.flatnonzero(is_cp)
     bis = cp_inds[:-1]  # Last changepoint is "fake".
     eis = cp_inds[1:] -1
 
+    # Ignore non-speech and overlapped speech.
+    turn_labels = labels[bis]
+    is_speech = turn_labels >= 2
+    bis = bis[is_speech]
+    eis = eis[is_speech]
+    turn_labels = turn_labels[is_speech]
+
     # Write turns to RTTM.
+    onsets = bis*step
+    durations = (eis - bis + 1)*step
+    recording_id = rttm_path.stem
+    # The fields that are constant across turns are formatted only once.
+    line_fmt = (
+        f'SPEAKER {recording_id} {channel} %.{precision}f %.{precision}f '
+        f'<NA> <NA> speaker%d <NA> <NA>\n')
+    lines = map(
+        line_fmt.__mod__,
+        zip(onsets.tolist(), durations.tolist(), turn_labels.tolist()))
     with open(rttm_path, 'w') as f:
-        for bi, ei in zip(bis, eis):
-            label = labels[bi]
-            if label < 2:
-                # Ignore non-speech and overlapped speech.
-                continue
-            n_frames = ei - bi + 1
-            duration = n_frames*step
-            onset = bi*step
-            recording_id = rttm_path.stem
-            line = f'SPEAKER {recording_id} {channel} {onset:.{precision}f} {duration:.{precision}f} <NA> <NA> speaker{label} <NA> <NA>\n'
-            f.write(line)
+        f.write(''.join(lines))
+
+
+def process_recording(recording_id, args, m, iE, w, V, feats, n_frames, segs,
+                      VtiEV=None, writer=None):
+    """Resegment a single recording and write the result to RTTM.
+
+    Parameters
+    ----------
+    recording_id : str
+        Recording id.
+
+    args : argparse.Namespace
+        Parsed command line arguments.
+
+    m, iE, w : ndarray
+        Diagonal UBM parameters. See ``load_dubm``.
+
+    V : ndarray
+        I-vector extractor parameters. See ``load_ivector_extractor``.
+
+    feats : ndarray, (n_frames, n_dims) or str
+        MFCC features for the recording, or the extended filename to load them
+        from. In the latter case, the features are only loaded if the initial
+        segmentation contains non-overlapping speech.
+
+    n_frames : int
+        Length of recording in frames.
+
+    segs : Segmentation
+        Initial segmentation of recording.
+
+    VtiEV : ndarray, optional
+        Precomputed ``VB_diarization.precalculate_VtiEV(V, iE)``. If None, it
+        will be computed by ``VB_diarization``.
+        (Default: None)
+
+    writer : concurrent.futures.Executor, optional
+        If provided, the RTTM file is written asynchronously by submitting the
+        write to ``writer``.
+        (Default: None)
+
+    Returns
+    -------
+    write : concurrent.futures.Future or None
+        If ``writer`` was provided, the future for the RTTM write; otherwise,
+        None.
+    """
+    # Convert the initial segmentation (e.g., from AHC) into an array of
+    # frame-level integer labels, where:
+    # - 0: non-speech
+    # - 1: overlapping speech
+    # - n>1: speaker n
+    # We use 0 to denote silence frames and 1 to denote overlapping frames.
+    init_labels = get_labels(
+        segs, n_frames,
+        out=_get_buffer(
+            'init_labels', n_frames,
+            _label_dtype(segs.speaker_labels.max(initial=1))),
+        assume_no_overlap=args.assume_no_overlap)
+    if not args.quiet:
+        print(f'INITIAL SEGMENTATION DIAGNOSTICS for "{recording_id}"')
+        print_diagnostics(init_labels)
+
+
+    # Drop frames corresponding to silence and overlapped speech. Only the
+    # retained frames are converted to the working precision.
+    mask = np.greater_equal(
+        init_labels, 2, out=_get_buffer('mask', n_frames, bool))
+    speech_inds = np.flatnonzero(mask)
+    if len(speech_inds) == 0:
+        print(
+            f"Warning: the initial segmentation for {recording_id} has no "
+            f"non-overlapping speech.")
+        return None
+    if isinstance(feats, str):
+        feats = load_feats(feats)
+    X_masked = _get_buffer(
+        'X_masked', (len(speech_inds), feats.shape[1]), args.dtype)
+    if feats.dtype == X_masked.dtype:
+        np.take(feats, speech_inds, axis=0, out=X_masked)
+    else:
+        X_masked[...] = feats[speech_inds]
+    init_labels_masked = init_labels[speech_inds] - 2  # So labeling starts at 0.
+
+    # Initialize the posterior of each speaker based on the initial
+    # segmentation.
+    if args.initialize:
+        q = VB_diarization.frame_labels2posterior_mx(
+            init_labels_masked, args.max_speakers)
+    else:
+        q = None
+        print("RANDOM INITIALIZATION\n")
+
+    # Perform VB resegmentation of the NON-OVERLAPPED speech.
+    #
+    # q  - S x T matrix of speaker posteriors whose i-th row is the
+    #      attribution of frame i to the S possible speakers
+    #      (args.max_speakers). T is the total number of frames.
+    # sp - S dimensional column vector of ML learned speaker priors. Ideally,
+    #      these should allow to estimate # of speaker in the recording as the
+    #      probabilities of the redundant speaker should converge to zero.
+    # Li - values of auxiliary function (and DER and frame cross-entropy
+    #      between q and reference if 'ref' is provided) over iterations.
+    q_out, sp_out, L_out = VB_diarization.VB_diarization(
+        X_masked, recording_id, m, iE, w, V, sp=None, q=q,
+        maxSpeakers=args.max_speakers, maxIters=args.max_iters, VtiEV=VtiEV,
+        downsample=args.downsample, alphaQInit=args.alphaQInit,
+        sparsityThr=args.sparsityThr, epsilon=args.epsilon,
+        minDur=args.minDur, loopProb=args.loopProb, statScale=args.statScale,
+        llScale=args.llScale, ref=None, plot=False)
+
+    # Reconstruct a labeling relative to the original UNMASKED frames. Note
+    # that in the following, we simply ignore overlap frames entirely and
+    # treat them as silence. When the initial segmentation has no overlaps
+    # (e..g, output of AHC) this is not problematic, but it is less than
+    # ideal if there initial segmentation accounts for overlaps.
+    predicted_labels_masked = _get_buffer(
+        'predicted_labels_masked', len(q_out), np.intp)
+    np.argmax(q_out, 1, out=predicted_labels_masked)
+    predicted_labels_masked += 2
+    predicted_labels = _get_buffer(
+        'predicted_labels', n_frames, _label_dtype(args.max_speakers + 1))
+    predicted_labels.fill(0)
+    predicted_labels[speech_inds] = predicted_labels_masked
+
+    # More diagnostics.
+    if not args.quiet:
+        print(f'RESEGMENTATION DIAGNOSTICS for "{recording_id}"')
+        print_diagnostics(predicted_labels)
+        print(f"LEARNED SPEAKER PRIORS: "
+              f"{np.array2string(sp_out, precision=3, suppress_small=True)}")
+        aux_loss = np.squeeze(L_out)
+        print('AUX LOSS VALUES')
+        for n, l in enumerate(aux_loss):
+            print(f"ITER: {n}, LOSS: {l}")
+
+
+    # Create the output rttm file and compute the DER after re-segmentation.
+    rttm_path = Path(args.output_dir, "per_file_rttm", recording_id + '.rttm')
+    if writer is None:
+        write_rttm_file(
+            rttm_path, predicted_labels, channel=args.channel, step=args.step,
+            precision=2)
+        return None
+    # Copy the labels as the buffer will be reused for the next recording.
+    return writer.submit(
+        write_rttm_file, rttm_path, predicted_labels.copy(),
+        channel=args.channel, step=args.step, precision=2)
+
+
+def _init_globals(m, iE, w, V, VtiEV, max_frames=0):
+    """Set model parameters used by ``_resegment_recording``.
+
+    ``max_frames`` is the length in frames of the longest recording that will
+    be processed and is used to size the scratch buffers.
+    """
+    _MODEL.update(m=m, iE=iE, w=w, V=V, VtiEV=VtiEV, max_frames=max_frames)
+    _BUFFERS.clear()
+
+
+def _save_model(model_dir, m, iE, w, V, VtiEV):
+    """Save model parameters to ``.npy`` files in ``model_dir``."""
+    for name, param in zip(_MODEL_PARAMS, (m, iE, w, V, VtiEV)):
+        np.save(Path(model_dir, name + '.npy'), param)
+
+
+def _init_worker(model_dir, max_frames=0):
+    """Set model parameters from the files saved by ``_save_model``.
+
+    The files are memory-mapped read-only, so that all worker processes share
+    a single copy of the parameters through the page cache.
+    """
+    params = {
+        name: np.asarray(
+            np.load(Path(model_dir, name + '.npy'), mmap_mode='r'))
+        for name in _MODEL_PARAMS}
+    _init_globals(**params, max_frames=max_frames)
+
+
+def _get_buffer(name, shape, dtype):
+    """Return uninitialized scratch array of the specified shape and dtype.
+
+    The array is a view of a per-process buffer that is reused across
+    recordings. Buffers are sized to hold the longest recording and are only
+    reallocated if a larger array is requested.
+    """
+    shape = np.atleast_1d(shape)
+    buf = _BUFFERS.get(name)
+    if (buf is None or buf.dtype != dtype or buf.shape[0] < shape[0]
+            or buf.shape[1:] != tuple(shape[1:])):
+        n_rows = max(shape[0], _MODEL.get('max_frames', 0))
+        buf = np.empty((n_rows, *shape[1:]), dtype=dtype)
+        _BUFFERS[name] = buf
+    return buf[:shape[0]]
+
+
+def _read_feats_ahead(feats_rxfilenames, segs, n_ahead=1):
+    """Yield feature matrices, reading up to ``n_ahead`` ahead in a thread.
+
+    This allows the features for the next recording to be read while the
+    current recording is being resegmented. Recordings whose segmentation in
+    ``segs`` is empty are not read; their rxfilename is yielded instead, as
+    ``process_recording`` returns before loading features for them.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = deque()
+        for feats_rxfilename, rec_segs in zip(feats_rxfilenames, segs):
+            if len(rec_segs.onsets):
+                future = executor.submit(load_feats, feats_rxfilename)
+            else:
+                future = Future()
+                future.set_result(feats_rxfilename)
+            pending.append(future)
+            if len(pending) > n_ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _resegment_recording(recording_id, feats, n_frames, segs, args,
+                         writer=None):
+    """Resegment a recording using the model set by ``_init_globals``."""
+    write = process_recording(
+        recording_id, args, _MODEL['m'], _MODEL['iE'], _MODEL['w'],
+        _MODEL['V'], feats, n_frames, segs, VtiEV=_MODEL['VtiEV'],
+        writer=writer)
+    print("")
+    print("------------------------------------------------------------------------")
+    print("")
+    return write
+
+
+def _resegment_recording_captured(recording_id, feats, n_frames, segs, args):
+    """Resegment a recording, capturing the output printed while doing so.
+
+    The captured output is returned so that logs from recordings processed in
+    parallel are not interleaved. If processing fails, it is printed before the
+    exception is propagated.
+
+    The RNG is reseeded for each recording so that results do not depend on
+    which worker processes the recording or in what order.
+    """
+    np.random.seed(args.seed)
+    log = io.StringIO()
+    failed = True
+    try:
+        with contextlib.redirect_stdout(log):
+            _resegment_recording(recording_id, feats, n_frames, segs, args)
+        failed = False
+    finally:
+        if failed:
+            print(log.getvalue(), end='', flush=True)
+    return log.getvalue()
 
 
 def main():
@@ -384,9 +884,33 @@ def main():
     parser.add_argument(
         '--initialize', default=False, action='store_true',
         help='Initialize speaker posteriors from RTTM')
+    parser.add_argument(
+        '--assume-no-overlap', default=False, action='store_true',
+        help='Label frames of the initial segmentation with a method that is '
+             'faster when few turns share frames. Overlapping turns are still '
+             'detected, so frame labels are the same as without this flag')
+    parser.add_argument(
+        '--cache-rttm', default=False, action='store_true',
+        help='Cache the parsed initial RTTM file alongside it and reuse the '
+             'cache on subsequent runs if the RTTM file is unchanged')
     parser.add_argument(
         '--seed', metavar='SEED', type=int, default=1036527419,
-        help='seed for RNG (default: %(default)s)')
+        help='seed for RNG. With JOBS > 1, the RNG is reseeded for each '
+             'recording, so without --initialize results differ from those '
+             'of a serial run (default: %(default)s)')
+    parser.add_argument(
+        '--dtype', metavar='DTYPE', default='float32',
+        choices=['float32', 'float64'],
+        help='Floating point precision of features and model parameters used '
+             'for VB-HMM (default: %(default)s)')
+    parser.add_argument(
+        '--quiet', default=False, action='store_true',
+        help='Do not print per-recording diagnostics')
+    parser.add_argument(
+        '--jobs', metavar='JOBS', type=int, default=1,
+        help='Number of recordings to resegment in parallel. Workers share '
+             'the model through memory-mapped copies saved to a temporary '
+             'directory in the output directory (default: %(default)s)')
     if len(sys.argv) == 1:
         parser.print_help()
         sys.exit(1)
@@ -401,106 +925,83 @@ def main():
     # Load the diagonal UBM and i-vector extractor.
     m, iE, w = load_dubm(args.dubm_model)
     V = load_ivector_extractor(args.ie_model)
+    m = m.astype(args.dtype, copy=False)
+    iE = iE.astype(args.dtype, copy=False)
+    V = V.astype(args.dtype, copy=False)
+
+    # The V^T iE V terms depend only on the model, so compute them once rather
+    # than for each recording.
+    VtiEV = VB_diarization.precalculate_VtiEV(V, iE)
 
-    # Load the MFCC features
-    feats_dict = {}
-    feats_scp_path = Path(args.data_dir, "feats.scp")
-    for key,mat in kaldi_io.read_mat_scp(str(feats_scp_path)):
-        feats_dict[key] = mat
+    # Locate the MFCC features. These are read one recording at a time as
+    # needed rather than all loaded up front.
+    feats_rxfilenames = load_scp(Path(args.data_dir, "feats.scp"))
 
     # Load segments for target recordings.
     frame_counts = load_frame_counts(
         Path(args.data_dir, "utt2num_frames"))
     recording_ids = sorted(frame_counts.keys())
+    max_frames = max(frame_counts.values(), default=0)
     recordings = load_rttm(
         args.init_rttm_filename, frame_counts, step=args.step,
-        target_rec_ids=recording_ids)
+        target_rec_ids=recording_ids, cache=args.cache_rttm)
 
     print("------------------------------------------------------------------------")
     print("")
 
-    # Resegment the recordings serially.
-    for recording_id in recording_ids:
-        # Convert the initial segmentation (e.g., from AHC) into an array of
-        # frame-level integer labels, where:
-        # - 0: non-speech
-        # - 1: overlapping speech
-        # - n>1: speaker n
-        # We use 0 to denote silence frames and 1 to denote overlapping frames.
-        init_labels = get_labels(
-            recordings[recording_id], frame_counts[recording_id])
-        print(f'INITIAL SEGMENTATION DIAGNOSTICS for "{recording_id}"')
-        print_diagnostics(init_labels)
-
-
-        # Grab the corresponding features.
-        X = feats_dict[recording_id].astype(np.float64)
-
-        # Drop frames corresponding to silence and overlapped speech.
-        mask = (init_labels >= 2)
-        X_masked = X[mask]
-        init_labels_masked = init_labels[mask]
-        init_labels_masked -= 2  # So the labeling starts at 0.
-        if len(init_labels) == 0:
-            print(
-                f"Warning: the initial segmentation for {recording_id} has no "
-                f"non-overlapping speech.")
-            continue
-
-        # Initialize the posterior of each speaker based on the initial
-        # segmentation.
-        if args.initialize:
-            q = VB_diarization.frame_labels2posterior_mx(
-                init_labels_masked, args.max_speakers)
-        else:
-            q = None
-            print("RANDOM INITIALIZATION\n")
-
-        # Perform VB resegmentation of the NON-OVERLAPPED speech.
-        #
-        # q  - S x T matrix of speaker posteriors whose i-th row is the
-        #      attribution of frame i to the S possible speakers
-        #      (args.max_speakers). T is the total number of frames.
-        # sp - S dimensional column vector of ML learned speaker priors. Ideally,
-        #      these should allow to estimate # of speaker in the recording as the
-        #      probabilities of the redundant speaker should converge to zero.
-        # Li - values of auxiliary function (and DER and frame cross-entropy
-        #      between q and reference if 'ref' is provided) over iterations.
-        q_out, sp_out, L_out = VB_diarization.VB_diarization(
-            X_masked, recording_id, m, iE, w, V, sp=None, q=q,
-            maxSpeakers=args.max_speakers, maxIters=args.max_iters, VtiEV=None,
-            downsample=args.downsample, alphaQInit=args.alphaQInit,
-            sparsityThr=args.sparsityThr, epsilon=args.epsilon,
-            minDur=args.minDur, loopProb=args.loopProb, statScale=args.statScale,
-            llScale=args.llScale, ref=None, plot=False)
-
-        # Reconstruct a labeling relative to the original UNMASKED frames. Note
-        # that in the following, we simply ignore overlap frames entirely and
-        # treat them as silence. When the initial segmentation has no overlaps
-        # (e..g, output of AHC) this is not problematic, but it is less than
-        # ideal if there initial segmentation accounts for overlaps.
-        predicted_labels_masked = np.argmax(q_out, 1) + 2
-        predicted_labels = (np.zeros(len(mask))).astype(int)
-        predicted_labels[mask] = predicted_labels_masked
-
-        # More diagnostics.
-        print(f'RESEGMENTATION DIAGNOSTICS for "{recording_id}"')
-        print_diagnostics(predicted_labels)
-        print(f"LEARNED SPEAKER PRIORS: "
-              f"{np.array2string(sp_out, precision=3, suppress_small=True)}")
-        aux_loss = np.squeeze(L_out)
-        print('AUX LOSS VALUES')
-        for n, l in enumerate(aux_loss):
-            print(f"ITER: {n}, LOSS: {l}")
-
-
-        # Create the output rttm file and compute the DER after re-segmentation.
-        write_rttm_file(
-            Path(args.output_dir, "per_file_rttm", recording_id + '.rttm'),
-            predicted_labels, channel=args.channel, step=args.step, precision=2)
-        print("")
-        print("------------------------------------------------------------------------")
-        print("")
+    # Resegment the recordings. Features are loaded on demand: when running
+    # serially, the next recording's features are read in the background while
+    # the current one is processed; otherwise, by whichever process handles the
+    # recording.
+    if args.jobs > 1:
+        # Start the longest recordings first so that workers are not left idle
+        # waiting on a long recording at the end of the run.
+        recording_ids = sorted(
+            recording_ids, key=frame_counts.get, reverse=True)
+    feats_rxfilenames = [
+        feats_rxfilenames[recording_id] for recording_id in recording_ids]
+    n_frames = [frame_counts[recording_id] for recording_id in recording_ids]
+    segs = [recordings.get(recording_id, Segmentation(recording_id, [], [], []))
+            for recording_id in recording_ids]
+    if args.jobs == 1:
+        # RTTM files are written in the background while the next recording is
+        # processed. Waiting on the previous write before queuing the next one
+        # surfaces any errors and bounds the number of pending writes.
+        _init_globals(m, iE, w, V, VtiEV, max_frames)
+        feats = _read_feats_ahead(feats_rxfilenames, segs)
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            pending_write = None
+            for write in map(
+                    partial(_resegment_recording, args=args, writer=writer),
+                    recording_ids, feats, n_frames, segs):
+                if pending_write is not None:
+                    pending_write.result()
+                pending_write = write
+            if pending_write is not None:
+                pending_write.result()
+    else:
+        # Limit each worker to a single BLAS/OpenMP thread so that the workers
+        # do not oversubscribe the CPUs. These variables are only read when
+        # NumPy is imported, so workers are spawned rather than forked from
+        # this process, which has already initialized its thread pools.
+        for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'MKL_NUM_THREADS']:
+            os.environ.setdefault(var, '1')
+        # Workers memory-map the model from files rather than each receiving a
+        # pickled copy, which for the i-vector extractor and V^T iE V terms
+        # can be hundreds of MB.
+        with tempfile.TemporaryDirectory(dir=args.output_dir) as model_dir:
+            _save_model(model_dir, m, iE, w, V, VtiEV)
+            with ProcessPoolExecutor(
+                    max_workers=args.jobs,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(model_dir, max_frames)) as executor:
+                for log in executor.map(
+                        partial(_resegment_recording_captured, args=args),
+                        recording_ids, feats_rxfilenames, n_frames, segs,
+                        chunksize=1):
+                    print(log, end='')
 
 
 if __name__ == "__main__":
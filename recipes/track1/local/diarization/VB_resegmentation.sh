@@ -63,6 +63,11 @@ channel=0
 # If true, initialize speaker posteriors from the initial segmentation.
 initialize=true
 
+# If true, label frames of the initial segmentation with a method that is faster
+# when few turns share frames. Labels are the same either way. AHC output does
+# not benefit, as its adjacent turns often share a boundary frame.
+assume_no_overlap=false
+
 
 ################################################################################
 # Logging
@@ -148,6 +153,9 @@ if [ $stage -le 0 ]; then
   if [ $initialize == true ]; then
       args="--initialize"
   fi
+  if [ $assume_no_overlap == true ]; then
+      args="$args --assume-no-overlap"
+  fi
   $cmd JOB=1:$nj $output_dir/log/VB_resegmentation.JOB.log \
     $PYTHON local/diarization/VB_resegmentation.py \
       $args \
@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 import argparse
 from collections import namedtuple
 import itertools
+from operator import attrgetter
 import os
 import sys
 
@@ -70,7 +71,7 @@ def main():
     make_dir(args.output_dir)
     turns = load_rttm(args.src_rttm_fn)
     for fid, file_turns in groupby(
-            turns, lambda x: x.fid):
+            turns, attrgetter('fid')):
         dest_rttm_fn = os.path.join(args.output_dir, fid + '.rttm')
         write_rttm(dest_rttm_fn, file_turns)
 
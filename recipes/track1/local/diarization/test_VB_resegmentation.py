@@ -0,0 +1,21 @@
+"""Tests for VB_resegmentation.py."""
+import pytest
+
+from VB_resegmentation import load_rttm
+
+
+RTTM_LINES = [
+    'SPEAKER rec0 1 0.00 1.00 <NA> <NA> spk0 <NA> <NA>',
+    'SPEAKER rec0 1 1.00 0.50 <NA> <NA> spk1 <NA> <NA>',
+    ]
+
+
+@pytest.mark.parametrize('cache', [False, True])
+def test_load_rttm_no_target_turns(tmp_path, cache):
+    # E.g., a split of the data directory whose recordings have no turns in
+    # the initial segmentation.
+    rttm_path = tmp_path / 'init.rttm'
+    rttm_path.write_text('\n'.join(RTTM_LINES) + '\n')
+    recordings = load_rttm(
+        rttm_path, {'rec1': 200}, target_rec_ids=['rec1'], cache=cache)
+    assert recordings == {}
@@ -36,11 +36,32 @@ as follows:
   - ...
 """
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+import heapq
 import itertools
+from operator import attrgetter
+import os
 from pathlib import Path
 import sys
 
+try:
+    from functools import cached_property
+except ImportError:
+    # Python 3.7.
+    class cached_property:
+        """Minimal backport of ``functools.cached_property``."""
+        def __init__(self, func):
+            self.func = func
+            self.__doc__ = func.__doc__
+
+        def __get__(self, instance, owner=None):
+            if instance is None:
+                return self
+            value = self.func(instance)
+            instance.__dict__[self.func.__name__] = value
+            return value
+
 
 @dataclass
 class Segment:
@@ -60,6 +81,7 @@ class Segment:
     label : str
         Segment label; e.g., "speech".
     """
+    __slots__ = ('utterance_id', 'onset', 'offset', 'label')
     utterance_id: str
     onset: float
     offset: float
@@ -92,6 +114,7 @@ class RTTMTurn:
     rttm_line : str
         Original line of turn in source RTTM file.
     """
+    __slots__ = ('recording_id', 'speaker_id', 'onset', 'offset', 'rttm_line')
     recording_id: str
     speaker_id: str
     onset: float
@@ -122,34 +145,26 @@ class Recording:
     audio_path: Path
     rttm_path: Path=None
 
-    def __post_init__(self):
-        self._segments = None
-        self._turns = None
-
-    @property
+    @cached_property
     def segments(self):
-        """Speech segments."""
-        if self._segments is None:
-            self._segments = read_label_file(self.lab_path)
-        return self._segments
+        """Speech segments, sorted by utterance id."""
+        return read_label_file(self.lab_path)
 
-    @property
+    @cached_property
     def turns(self):
         """Speaker turns in recording's diarization."""
-        if self._turns is None:
-            if self.rttm_path is None or not self.rttm_path.exists():
-                raise AttributeError(
-                    f'diarization not available for recording '
-                    f'"{self.recording_id}"')
-            self._turns = read_rttm_file(self.rttm_path)
-        return self._turns
+        if self.rttm_path is None or not self.rttm_path.exists():
+            raise AttributeError(
+                f'diarization not available for recording '
+                f'"{self.recording_id}"')
+        return read_rttm_file(self.rttm_path)
 
-    @property
+    @cached_property
     def speakers(self):
         """Speakers present on recording."""
-        return set(turn.speaker_id for turn in self.turns)
+        return frozenset(turn.speaker_id for turn in self.turns)
 
-    @property
+    @cached_property
     def num_speakers(self):
         """Number of speakers present on recording."""
         return len(self.speakers)
@@ -177,14 +192,22 @@ class Recording:
             Recordings.
         """
         flac_dir = Path(flac_dir)
+        sad_dir = Path(sad_dir)
+        if rttm_dir is not None:
+            rttm_dir = Path(rttm_dir)
+        has_rttm = rttm_dir is not None and rttm_dir.exists()
         recordings = []
-        flac_paths = sorted(flac_dir.glob('*.flac'))
-        for flac_path in flac_paths:
-            recording_id = flac_path.stem
-            lab_path = Path(sad_dir, recording_id + '.lab')
+        with os.scandir(flac_dir) as entries:
+            flac_names = sorted(
+                entry.name for entry in entries
+                if entry.name.endswith('.flac') and entry.is_file())
+        for flac_name in flac_names:
+            recording_id = flac_name[:-len('.flac')]
+            flac_path = flac_dir / flac_name
+            lab_path = sad_dir / (recording_id + '.lab')
             rttm_path = None
-            if rttm_dir is not None and rttm_dir.exists():
-                rttm_path = Path(rttm_dir, recording_id + '.rttm')
+            if has_rttm:
+                rttm_path = rttm_dir / (recording_id + '.rttm')
             recordings.append(Recording(
                 recording_id, lab_path, flac_path, rttm_path))
         return recordings
@@ -201,20 +224,35 @@ def read_label_file(lab_path):
     Returns
     -------
     list of Segment
-        Segments.
+        Segments, sorted by utterance id.
     """
     lab_path = Path(lab_path)
     recording_id = lab_path.stem
     with open(lab_path, 'r') as f:
-        segs = []
-        for n, line in enumerate(f, start=1):
-            onset, offset, label = line.strip().split()
-            utterance_id = f'{recording_id}_{n:04d}'
-            segs.append(
-                Segment(utterance_id, onset, offset, label))
+        lines = f.read().splitlines()
+
+    # Onsets/offsets are kept as the original strings so that they are
+    # written to the segments file exactly as they appear in the label file.
+    segs = []
+    for n, line in enumerate(lines, start=1):
+        fields = line.split()
+        if len(fields) != 3:
+            raise ValueError(
+                f'Line {n} of label file "{lab_path}" is not of the form '
+                f'"<onset> <offset> <label>": {line!r}')
+        onset, offset, label = fields
+        segs.append(
+            Segment(f'{recording_id}_{n:04d}', onset, offset, label))
+
+    # File order only matches utterance id order for files with fewer than
+    # 10,000 segments as indices are zero-padded to 4 digits.
+    segs.sort(key=attrgetter('utterance_id'))
     return segs
 
 
+_turn_sort_key = attrgetter('recording_id', 'onset', 'offset')
+
+
 def read_rttm_file(rttm_path):
     """Load speaker turns from RTTM file.
 
@@ -226,21 +264,78 @@ def read_rttm_file(rttm_path):
     Returns
     -------
     list of Turn
-       Speaker turns.
+       Speaker turns, sorted by recording id, onset, and offset.
     """
     with open(rttm_path, 'r') as f:
-        turns = []
-        for line in f:
-            fields = line.strip().split()
-            recording_id = fields[1]
-            onset = float(fields[3])
-            offset = onset + float(fields[4])
-            speaker_id = fields[7]
-            turns.append(
-                RTTMTurn(recording_id, speaker_id, onset, offset, line))
+        lines = f.readlines()
+    turns = []
+    for line in lines:
+        fields = line.split()
+        onset = float(fields[3])
+        turns.append(RTTMTurn(
+            fields[1], fields[7], onset, onset + float(fields[4]), line))
+    turns.sort(key=_turn_sort_key)
     return turns
 
 
+def preload_recordings(recordings, load_turns=False):
+    """Concurrently read the label and RTTM files of recordings.
+
+    The results are cached on the recordings, so that subsequent accesses of
+    ``segments`` and ``turns`` do not touch the disk.
+
+    Parameters
+    ----------
+    recordings : list of Recording
+        Recordings.
+
+    load_turns : bool, optional
+        If True, also read RTTM files.
+        (Default: False)
+    """
+    # Assign the results directly, as concurrent first accesses of a
+    # cached_property are serialized by a lock on some Python versions.
+    with ThreadPoolExecutor() as executor:
+        lab_paths = [recording.lab_path for recording in recordings]
+        for recording, segments in zip(
+                recordings, executor.map(read_label_file, lab_paths)):
+            recording.segments = segments
+        if load_turns:
+            # Recordings without RTTM files are skipped, so that accessing
+            # their turns still raises the usual error.
+            recordings = [
+                recording for recording in recordings
+                if recording.rttm_path is not None
+                and recording.rttm_path.exists()]
+            rttm_paths = [recording.rttm_path for recording in recordings]
+            for recording, turns in zip(
+                    recordings, executor.map(read_rttm_file, rttm_paths)):
+                recording.turns = turns
+
+
+def merge_turns(turn_lists):
+    """Merge sorted lists of speaker turns.
+
+    Parameters
+    ----------
+    turn_lists : list of list of RTTMTurn
+        Lists of speaker turns, each sorted by recording id, onset, and
+        offset.
+
+    Returns
+    -------
+    iterator of RTTMTurn
+        Speaker turns, sorted by recording id, onset, and offset.
+    """
+    # Usually each list holds the turns of a single recording and the lists
+    # are ordered by recording id, in which case concatenating them suffices.
+    turn_lists = [turns for turns in turn_lists if turns]
+    if all(_turn_sort_key(prev[-1]) <= _turn_sort_key(curr[0])
+           for prev, curr in zip(turn_lists[:-1], turn_lists[1:])):
+        return itertools.chain.from_iterable(turn_lists)
+    return heapq.merge(*turn_lists, key=_turn_sort_key)
+
+
 def write_rttm_file(rttm_path, turns):
     """Write speaker turns to RTTM file.
 
@@ -249,14 +344,11 @@ def write_rttm_file(rttm_path, turns):
     rttm_path : Path
         Path to output RTTM file.
 
-    turns : list of Turn
-        Speaker turns.
+    turns : iterable of RTTMTurn
+        Speaker turns, sorted by recording id, onset, and offset.
     """
     with open(rttm_path, 'w') as f:
-        turns = sorted(
-            turns, key=lambda x: (x.recording_id, x.onset, x.offset))
-        for turn in turns:
-            f.write(turn.rttm_line)
+        f.writelines(turn.rttm_line for turn in turns)
 
 
 def write_wav_script_file(wav_scp_path, recordings, target_sr=16000):
@@ -274,47 +366,57 @@ def write_wav_script_file(wav_scp_path, recordings, target_sr=16000):
         Resample audio to ``target_sr`` Hz.
         (Default: 16000)
     """
+    lines = []
+    for recording in recordings:
+        efname = (f'sox {recording.audio_path} -t wav -b 16 - '
+                  f'rate {target_sr} remix 1 |')
+        lines.append(f'{recording.recording_id} {efname}\n')
     with open(wav_scp_path, 'w') as f:
-        for recording in recordings:
-            efname = (f'sox {recording.audio_path} -t wav -b 16 - '
-                      f'rate {target_sr} remix 1 |')
-            line = f'{recording.recording_id} {efname}\n'
-            f.write(line)
+        f.write(''.join(lines))
 
 
-def write_utt2spk(utt2spk_path, recordings):
-    """Write ``utt2spk`` file.
+def write_kaldi_data_files(utt2spk_path, segments_path, recordings):
+    """Write ``utt2spk`` and ``segments`` files.
 
     Each utterance is assigned its corresponding recording id as the speaker.
-    """
-    with open(utt2spk_path, 'w') as f:
-        recordings = sorted(recordings, key=lambda x: x.recording_id)
-        for recording in recordings:
-            segments = sorted(recording.segments, key=lambda x: x.utterance_id)
-            for segment in segments:
-                line = f'{segment.utterance_id} {recording.recording_id}\n'
-                f.write(line)
+    Both files are written in a single pass over the segments.
+    ``recordings`` should be sorted by recording id.
 
+    Parameters
+    ----------
+    utt2spk_path : Path
+        Path to output ``utt2spk`` file.
+
+    segments_path : Path
+        Path to output ``segments`` file.
 
-def write_segments_file(segments_path, recordings):
-    """Write ``segments`` file."""
+    recordings : list of Recording
+        Recordings.
+    """
+    utt2spk_lines = []
+    segments_lines = []
+    for recording in recordings:
+        recording_id = recording.recording_id
+        for segment in recording.segments:
+            utt2spk_line = f'{segment.utterance_id} {recording_id}'
+            utt2spk_lines.append(utt2spk_line + '\n')
+            segments_lines.append(
+                f'{utt2spk_line} {segment.onset} {segment.offset}\n')
+    with open(utt2spk_path, 'w') as f:
+        f.write(''.join(utt2spk_lines))
     with open(segments_path, 'w') as f:
-        recordings = sorted(recordings, key=lambda x: x.recording_id)
-        for recording in recordings:
-            segments = sorted(recording.segments, key=lambda x: x.utterance_id)
-            for segment in segments:
-                line = (f'{segment.utterance_id} {recording.recording_id} '
-                        f'{segment.onset} {segment.offset}\n')
-                f.write(line)
+        f.write(''.join(segments_lines))
 
 
 def write_reco2num_spk(reco2num_spk_path, recordings):
-    """Write ``reco2num_spk`` file."""
+    """Write ``reco2num_spk`` file.
+
+    ``recordings`` should be sorted by recording id.
+    """
+    lines = [f'{recording.recording_id} {recording.num_speakers}\n'
+             for recording in recordings]
     with open(reco2num_spk_path, 'w') as f:
-        recordings = sorted(recordings, key=lambda x: x.recording_id)
-        for recording in recordings:
-            line = f'{recording.recording_id} {recording.num_speakers}\n'
-            f.write(line)
+        f.write(''.join(lines))
 
 
 def warning(msg):
@@ -359,18 +461,18 @@ def main():
             keep_rec_ids = {line.strip() for line in f}
         recordings = [rec for rec in recordings
                       if rec.recording_id in keep_rec_ids]
+    recordings.sort(key=attrgetter('recording_id'))
+    preload_recordings(recordings, load_turns=has_rttm)
     write_wav_script_file(
         Path(args.data_dir, 'wav.scp'), recordings, target_sr=args.target_sr)
-    write_segments_file(
-        Path(args.data_dir, 'segments'), recordings)
-    write_utt2spk(
-        Path(args.data_dir, 'utt2spk'), recordings)
+    write_kaldi_data_files(
+        Path(args.data_dir, 'utt2spk'), Path(args.data_dir, 'segments'),
+        recordings)
     if has_rttm:
         write_reco2num_spk(
             Path(args.data_dir, 'reco2num_spk'), recordings)
-    if has_rttm:
-        turns = list(itertools.chain.from_iterable(
-            recording.turns for recording in recordings))
+        turns = merge_turns(
+            [recording.turns for recording in recordings])
         write_rttm_file(
             Path(args.data_dir, 'rttm'), turns)
 
@@ -30,8 +30,6 @@ from pathlib import Path
 import sys
 sys.path.insert(0, 'steps')
 
-import numpy as np
-
 import libs.common as common_lib
 
 
@@ -65,15 +63,19 @@ def run(args):
     priors = common_lib.read_matrix_ascii(args.priors)
     if len(priors) != 0 and len(priors[0]) != 3:
         raise RuntimeError(f'Invalid dimension for priors {priors}')
-    priors = np.squeeze(np.array(priors, dtype=np.float64))
+    nonspeech_prior, speech_prior, _ = map(float, priors[0])
 
     # Create matrix that converts posteriors to likelihoods by dividing by
-    # normalized priors.
-    pmass = priors[0] + priors[1]  # Total mass devoted to speech/non-speech.
-    priors /= pmass
-    transform_mat = np.diag(1 / priors)
-    transform_mat[2, 2] = 0.0  # Ignore garbage entirely
-    transform_mat[1, 1] *= args.speech_likelihood_weight
+    # normalized priors. The matrix is always 3x3, so it is built directly
+    # rather than importing NumPy just to call np.diag.
+    # - pmass  --  total mass devoted to speech/non-speech
+    pmass = nonspeech_prior + speech_prior
+    nonspeech_prior /= pmass
+    speech_prior /= pmass
+    transform_mat = [
+        [1 / nonspeech_prior, 0.0, 0.0],
+        [0.0, 1 / speech_prior * args.speech_likelihood_weight, 0.0],
+        [0.0, 0.0, 0.0]]  # Ignore garbage entirely.
     common_lib.write_matrix_ascii(sys.stdout, transform_mat)
 
 
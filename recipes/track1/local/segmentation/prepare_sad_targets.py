@@ -42,13 +42,11 @@ targets directory, see:
 import argparse
 from collections import defaultdict
 from dataclasses import dataclass
-import numbers
 from pathlib import Path
 import sys
 
 import kaldi_io
 import numpy as np
-from scipy.ndimage import convolve1d
 
 
 def _seconds_to_frames(t, step):
@@ -67,55 +65,118 @@ def _seconds_to_frames(t, step):
     ndarray
         Frame indices corresponding to ``t``.
     """
-    t = np.array(t, dtype=np.float32, copy=False)
-    return np.array(t/step, dtype=np.int32)
+    # Computed in double precision, as float32 misplaces times beyond a few
+    # hours. The tolerance keeps times that lie on frame boundaries (e.g.,
+    # 1.19 seconds with a step of 0.01) from being floored into the preceding
+    # frame due to rounding error.
+    frames = np.multiply(t, 1.0/step, dtype=np.float64)
+    frames += 1e-6
+    np.floor(frames, out=frames)
+    return frames.astype(np.int32)
+
+
+def _count_per_block(mask, subsample_factor):
+    """Count True elements of ``mask`` within blocks of frames.
+
+    The i-th block consists of frames ``i*subsample_factor + 1`` through
+    ``(i + 1)*subsample_factor``, except for the last, which is shifted back to
+    end at the final frame. Recordings shorter than a block are padded by
+    repeating the first frame. This matches the blocks averaged over by
+    Kaldi's ``resample_targets.py``. If ``subsample_factor`` is 1, ``mask``
+    itself is returned.
+    """
+    if subsample_factor == 1:
+        return mask
+    n_frames = len(mask)
+    n_frames_sub = (n_frames + subsample_factor - 1) // subsample_factor
+    counts = np.empty(n_frames_sub, dtype=np.int32)
+
+    # Sum full blocks as subsample_factor strided slices, which is much faster
+    # than reducing over a short axis.
+    end = (n_frames_sub - 1)*subsample_factor + 1
+    block_counts = counts[:-1]
+    block_counts[:] = mask[1:end:subsample_factor]
+    for offset in range(2, subsample_factor + 1):
+        block_counts += mask[offset:end:subsample_factor]
+
+    # Padding of recordings shorter than a block repeats the first frame.
+    last_block = mask[max(n_frames - subsample_factor, 0):]
+    n_pad = subsample_factor - len(last_block)
+    counts[-1] = np.count_nonzero(last_block) + n_pad*mask[0]
+    return counts
 
 
-def subsample_frames(frames, subsample_factor=1):
-    """Subsample frames by a factor of ``subsample_factor``.
+def build_targets(n_frames, speech_segmentation=None,
+                  annotated_segmentation=None, subsample_factor=1, out=None):
+    """Build frame-level SAD targets for a recording.
 
-    Similar to simply taking every ``subsample_factor``-th frame except that
-    it averages over blocks of ``subsample_factor`` frames rather than picking
-    a single point.
+    Frames covered by a speech segment are assigned to the speech class and
+    all other frames to the non-speech class. If ``annotated_segmentation``
+    is provided, frames not covered by it are assigned to the garbage class.
+
+    If ``subsample_factor`` > 1, the targets are subsampled by averaging over
+    blocks of ``subsample_factor`` frames (see ``_count_per_block``). The
+    class proportions of each block are computed directly from frame counts,
+    without building the full rate targets.
 
     Parameters
     ----------
-    frames : ndarray, (n_frames, n_dims)
-        Frames to subsample.
+    n_frames : int
+        Number of frames in recording.
+
+    speech_segmentation : Segmentation, optional
+        Speech segments. If None, the recording contains no speech.
+        (Default: None)
+
+    annotated_segmentation : Segmentation, optional
+        Annotated regions. If None, the entire recording is annotated.
+        (Default: None)
 
     subsample_factor : int, optional
         Factor to subsample by.
         (Default: 1)
 
+    out : ndarray, (n_frames_sub, 3), optional
+        Array of dtype float32 to write targets to. If None, a new array is
+        allocated.
+        (Default: None)
+
     Returns
     -------
-    ndarray, (n_subsampled_frames, n_dims)
-        Subsampled frames.
+    ndarray, (n_frames_sub, 3)
+        Targets. Columns correspond to non-speech, speech, and garbage.
 
     References
     ----------
     https://github.com/kaldi-asr/kaldi/blob/master/egs/wsj/s5/steps/segmentation/internal/resample_targets.py
     """
-    if not isinstance(subsample_factor, numbers.Integral):
-        raise ValueError('"subsample_factor" must be integer >= 1.')
-    if subsample_factor <= 1:
-        return frames
-
-    # Average frames using sliding windows of size subsample_factor with left
-    # edge of first window starting at origin.
-    filter = np.ones(subsample_factor) / subsample_factor
-    fwidth = subsample_factor // 2
-    smoothed_frames = convolve1d(
-        frames, filter, origin=-fwidth, axis=0, mode='nearest')
-
-    # Select every subsample_factor-th smoothed frame.
-    n_frames, dim = frames.shape
+    subsample_factor = max(subsample_factor, 1)
     n_frames_sub = (n_frames + subsample_factor - 1) // subsample_factor
-    inds = np.arange(n_frames_sub)*subsample_factor + subsample_factor
-    inds = np.minimum(inds, n_frames - 1)
-    frames_sub = smoothed_frames[inds, ]
-
-    return frames_sub
+    if out is None:
+        out = np.empty((n_frames_sub, 3), dtype=np.float32)
+    if n_frames_sub == 0:
+        return out
+    is_speech = None
+    if speech_segmentation is not None:
+        is_speech = speech_segmentation.to_mask(n_frames)
+    is_garbage = None
+    if annotated_segmentation is not None:
+        is_garbage = ~annotated_segmentation.to_mask(n_frames)
+
+    # Write the speech and garbage frame counts of each block and infer the
+    # non-speech counts. Without subsampling, blocks are single frames, so
+    # this writes the one-hot targets directly.
+    out[:, 1:] = 0
+    if is_speech is not None:
+        if is_garbage is not None:
+            is_speech &= ~is_garbage
+        out[:, 1] = _count_per_block(is_speech, subsample_factor)
+    if is_garbage is not None:
+        out[:, 2] = _count_per_block(is_garbage, subsample_factor)
+    out[:, 0] = subsample_factor - out[:, 1] - out[:, 2]
+    if subsample_factor > 1:
+        out /= subsample_factor
+    return out
 
 
 @dataclass
@@ -145,8 +206,8 @@ class Segmentation:
     step: float=0.01
 
     def __post_init__(self):
-        self.onsets = np.array(self.onsets, dtype=np.int32, copy=False)
-        self.offsets = np.array(self.offsets, dtype=np.int32, copy=False)
+        self.onsets = np.asarray(self.onsets, dtype=np.int32)
+        self.offsets = np.asarray(self.offsets, dtype=np.int32)
         if len(self.onsets) != len(self.offsets):
             raise ValueError(
                 f'"onsets" and "offsets" must have same length: '
@@ -166,6 +227,72 @@ class Segmentation:
         """Number of segments."""
         return len(self.onsets)
 
+    def merged(self):
+        """Return segmentation with overlapping segments merged.
+
+        Segments covering overlapping or adjacent frames are merged, so that
+        the result covers the same frames with disjoint segments sorted by
+        onset.
+
+        Returns
+        -------
+        Segmentation
+            Merged segmentation.
+        """
+        if self.num_segments == 0:
+            return self
+        order = np.argsort(self.onsets, kind='stable')
+        onsets = self.onsets[order]
+        offsets = self.offsets[order]
+
+        # A segment starts a new merged segment if it begins after the last
+        # frame covered by all preceding segments.
+        max_offsets = np.maximum.accumulate(offsets)
+        is_start = np.ones(self.num_segments, dtype=bool)
+        is_start[1:] = onsets[1:] > max_offsets[:-1] + 1
+        starts = np.flatnonzero(is_start)
+        return Segmentation(
+            self.recording_id, onsets[starts],
+            np.maximum.reduceat(offsets, starts), self.step)
+
+    def to_mask(self, n_frames):
+        """Return mask indicating which frames are covered by segments.
+
+        Frames ``onsets[i]`` through ``offsets[i]`` (inclusive) are considered
+        covered by the ``i``-th segment. Segments may overlap.
+
+        Parameters
+        ----------
+        n_frames : int
+            Number of frames in recording.
+
+        Returns
+        -------
+        ndarray, (n_frames,)
+            Boolean mask whose ``i``-th element is True if frame ``i`` is
+            covered by one or more segments.
+        """
+        onsets = np.clip(self.onsets, 0, n_frames)
+        offsets = np.clip(self.offsets + 1, 0, n_frames)
+
+        # For typical segmentations, with segments hundreds of frames long,
+        # assigning a slice per segment only touches covered frames and is
+        # fastest.
+        if self.num_segments < n_frames // 64:
+            mask = np.zeros(n_frames, dtype=bool)
+            for onset, offset in zip(onsets.tolist(), offsets.tolist()):
+                mask[onset:offset] = True
+            return mask
+
+        # For dense segmentations, mark +1/-1 at segment boundaries, then
+        # integrate.
+        delta = np.zeros(n_frames + 1, dtype=np.int32)
+        bounds, counts = np.unique(onsets, return_counts=True)
+        delta[bounds] += counts
+        bounds, counts = np.unique(offsets, return_counts=True)
+        delta[bounds] -= counts
+        return np.cumsum(delta[:n_frames], dtype=np.int32) > 0
+
     @staticmethod
     def read_segments_file(segments_path, step=0.01):
         """Load speech segments for recordings from Kaldi ``segments`` file.
@@ -229,48 +356,47 @@ def main():
 
     args.targets_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load segmentations.
+    # Load segmentations, merging any overlapping segments.
     speech_segments = Segmentation.read_segments_file(
         args.segments, step=args.frame_step)
     annotated_segments = {}
     if args.annotated_segments is not None:
         annotated_segments = Segmentation.read_segments_file(
             args.annotated_segments, step=args.frame_step)
+    for segments in [speech_segments, annotated_segments]:
+        for recording_id, segmentation in segments.items():
+            segments[recording_id] = segmentation.merged()
+
+    # Load frame counts.
+    num_frames = []
+    with open(args.utt2num_frames, 'r') as f:
+        for line in f:
+            recording_id, n_frames = line.strip().split()
+            num_frames.append((recording_id, int(n_frames)))
 
-    # Convert to targets.
+    # Convert to targets. Targets for each recording are built in a view of
+    # a single buffer sized for the longest recording.
     targets_scp_path = Path(args.targets_dir, 'targets.scp')
     targets_ark_path = Path(args.targets_dir, 'targets.ark')
     ark_scp_output = (f'ark:| copy-feats --compress=true ark:- '
                       f'ark,scp:{targets_ark_path},{targets_scp_path}')
-    with open(args.utt2num_frames, 'r') as f:
-        with kaldi_io.open_or_fd(ark_scp_output,'wb') as g:
-            for line in f:
-                recording_id, n_frames = line.strip().split()
-                n_frames = int(n_frames)
-
-                # Create targets.
-                targets = np.zeros(n_frames, dtype='int32')
-                if recording_id in speech_segments:
-                    segmentation = speech_segments[recording_id]
-                    for onset, offset in zip(
-                            segmentation.onsets, segmentation.offsets):
-                        targets[onset:offset+1] = 1
-                if recording_id in annotated_segments:
-                    segmentation = annotated_segments[recording_id]
-                    is_scored = np.zeros_like(targets, dtype=np.bool)
-                    for onset, offset in zip(
-                            segmentation.onsets, segmentation.offsets):
-                        is_scored[onset:offset+1] = True
-                    targets[~is_scored] = 2
-
-                # Convert targets to one-hot.
-                targets = np.eye(3)[targets]
-
-                # Subsample by requested factor.
-                targets = subsample_frames(targets, args.subsampling_factor)
-
-                # Write to script/archive files.
-                kaldi_io.write_mat(g, targets, key=recording_id)
+    subsample_factor = max(args.subsampling_factor, 1)
+    max_frames = max((n_frames for _, n_frames in num_frames), default=0)
+    max_frames_sub = (max_frames + subsample_factor - 1) // subsample_factor
+    targets_buf = np.empty((max_frames_sub, 3), dtype=np.float32)
+    with kaldi_io.open_or_fd(ark_scp_output,'wb') as g:
+        for recording_id, n_frames in num_frames:
+            # Create targets, subsampled by requested factor.
+            n_frames_sub = ((n_frames + subsample_factor - 1) //
+                            subsample_factor)
+            targets = build_targets(
+                n_frames, speech_segments.get(recording_id),
+                annotated_segments.get(recording_id),
+                subsample_factor=subsample_factor,
+                out=targets_buf[:n_frames_sub])
+
+            # Write to script/archive files.
+            kaldi_io.write_mat(g, targets, key=recording_id)
 
 
 if __name__ == '__main__':
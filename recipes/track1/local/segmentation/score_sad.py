@@ -93,8 +93,10 @@ References
   INTERSPEECH 2017. pp. 3587-3591.
 """
 import argparse
+import copy
 from dataclasses import dataclass
 from functools import partial
+import itertools
 import multiprocessing as mp
 from pathlib import Path
 import sys
@@ -126,6 +128,7 @@ class Recording:
     annnotated : Timeline
         Annotated regions of file; scoring will be limited to these regions.
     """
+    __slots__ = ('uri', 'ref_speech', 'sys_speech', 'annotated')
     uri: str
     ref_speech: Annotation
     sys_speech: Annotation
@@ -202,11 +205,15 @@ def read_segments_file(segments_path):
     """Read speech/non-speech annotations from Kaldi segments file."""
     columns = ['utterance_uri', 'recording_uri', 'onset', 'offset']
     segs_df = pd.read_csv(
-        segments_path, header=None, sep=' ', names=columns)
+        segments_path, header=None, sep=' ', names=columns,
+        dtype={'onset' : 'float64', 'offset' : 'float64'})
     annotations = {}
-    for recording_uri, segs in segs_df.groupby('recording_uri'):
-        records = [(Segment(seg.onset, seg.offset), '_', 'speech')
-                   for seg in segs.itertuples(index=False)]
+    for recording_uri, segs in segs_df.groupby('recording_uri', sort=False):
+        segments = map(
+            Segment, segs.onset.to_numpy().tolist(),
+            segs.offset.to_numpy().tolist())
+        records = zip(
+            segments, itertools.repeat('_'), itertools.repeat('speech'))
         ann = Annotation.from_records(records, uri=recording_uri)
         annotations[recording_uri] = ann
 
@@ -229,7 +236,7 @@ def load_domains(table_path):
     df = pd.read_csv(table_path, header=0, sep='\t')
     domains = {}
     for dname, recordings in df.groupby('domain').uri:
-        domains[dname] = set(recordings)
+        domains[dname] = frozenset(recordings)
     return domains
 
 
@@ -248,6 +255,8 @@ def sum_metrics(*metrics):
 
 
 def _score_one_recording(recording, metrics):
+    # Score using fresh copies so that each result holds only this recording.
+    metrics = copy.deepcopy(metrics)
     for mname in sorted(metrics):
         metric = metrics[mname]
         metric(
@@ -285,23 +294,33 @@ def score_recordings(recordings, metrics, domains=None, n_jobs=1):
         named "OVERALL".
     """
     domains = {} if domains is None else domains
-    domains['OVERALL'] = {recording.uri for recording in recordings}
 
-    # Accumulate raw stats for seach recording.
+    # Accumulate raw stats for seach recording. The metrics are pure Python,
+    # so parallelism requires processes; when running serially, score in this
+    # process rather than pickling every recording to a single worker.
     results = {}  # recording URI ==> metrics for that recording.
-    with mp.Pool(n_jobs) as pool:
-        f = partial(_score_one_recording, metrics=metrics)
-        for recording, result in zip(recordings, pool.imap(f, recordings)):
-            results[recording.uri] = result
-
-    # Aggregate by domain.
+    f = partial(_score_one_recording, metrics=metrics)
+    if n_jobs == 1:
+        for recording in recordings:
+            results[recording.uri] = f(recording)
+    else:
+        # Dispatch the recordings with the most segments first, so that a
+        # large recording arriving late does not leave the other workers idle.
+        recordings = sorted(
+            recordings, key=lambda x: len(x.ref_speech) + len(x.sys_speech),
+            reverse=True)
+        with mp.Pool(n_jobs) as pool:
+            for recording, result in zip(recordings, pool.imap(f, recordings)):
+                results[recording.uri] = result
+
+    domains['OVERALL'] = frozenset(results)
+
+    # Aggregate by domain. URIs are visited in sorted order so that the
+    # floating point sums do not depend on the (randomized) set order.
     per_domain_metrics = {}  # domain name ==> metrics for that domain.
     for dname in domains:
-        domain_results = []
-        for uri in sorted(domains[dname]):
-            if uri not in results:
-                continue
-            domain_results.append(results[uri])
+        domain_results = [
+            results[uri] for uri in sorted(domains[dname] & results.keys())]
         domain_metrics = {}
         for metric_name in metrics:
             domain_metrics[metric_name] = sum_metrics(